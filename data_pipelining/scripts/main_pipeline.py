@@ -1,12 +1,19 @@
-import subprocess
 import os
-import sys
+import argparse
+
+from process_leads import process_all_leads, merged_output_file
+from validate_emails import validate_leads
+from personalize_blurbs import generate_customs
 
 print("DEBUG: Using the updated main_pipeline.py in", __file__)
 
-def run_pipeline(input_file, final_output_file):
+def run_pipeline(input_file, final_output_file, keep_intermediate=False):
     """
     Runs the 3-step pipeline on 'input_file' and produces a final XLSX at 'final_output_file'.
+
+    All steps run in this process and hand their DataFrames straight to the
+    next step. The step 1 / step 2 intermediate files are only written when
+    'keep_intermediate' is True.
     """
     # 'script_dir' is the absolute path to the directory containing THIS main_pipeline.py
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -17,56 +24,76 @@ def run_pipeline(input_file, final_output_file):
 
     base_name = os.path.splitext(os.path.basename(input_file))[0]
 
-    # Step 1 output => processed_<base_name>.xlsx
-    processed_file = os.path.join(output_dir, f"processed_{base_name}.xlsx")
-    # Step 2 output => pro_<base_name>.xlsx (all) & validated_<base_name>.xlsx (good only)
-    validated_all = os.path.join(output_dir, f"pro_{base_name}.xlsx")
+    # Step 1 output => processed_<base_name>.parquet
+    # (runs before Parquet intermediates saved processed_<base_name>.xlsx)
+    processed_file = os.path.join(output_dir, f"processed_{base_name}.parquet")
+    legacy_processed_file = os.path.join(output_dir, f"processed_{base_name}.xlsx")
+    # Step 2 output => pro_<base_name>.parquet (all) & validated_<base_name>.xlsx (good only)
+    validated_all = os.path.join(output_dir, f"pro_{base_name}.parquet")
     validated_good = os.path.join(output_dir, f"validated_{base_name}.xlsx")
 
     # -----------------------------------------------------------------
     # Step 1: Processing Leads
     # -----------------------------------------------------------------
     print("Step 1: Processing Leads...")
-    process_leads_script = os.path.join(script_dir, "process_leads.py")
-    subprocess.run([
-        "python3",
-        process_leads_script,
-        "--input_file", input_file
-    ], check=True)
+    # A file recorded as processed is only skipped if an earlier run saved
+    # its step 1 output; otherwise it is processed again.
+    saved_file = next(
+        (path for path in (processed_file, legacy_processed_file) if os.path.exists(path)), None
+    )
+    processed_leads = process_all_leads(
+        input_folder=os.path.dirname(input_file),
+        single_file_name=os.path.basename(input_file),
+        output_folder=output_dir,
+        merged_output_file=merged_output_file,
+        save_processed=keep_intermediate,
+        reprocess=saved_file is None
+    )
+    if processed_leads is None:
+        # Already processed in an earlier run; reuse its saved step 1 output
+        processed_leads = saved_file
+    if processed_leads is None:
+        raise RuntimeError(f"Step 1 produced no leads for '{input_file}'")
 
     # -----------------------------------------------------------------
     # Step 2: Validate Emails
     # -----------------------------------------------------------------
     print("Step 2: Validating Emails...")
-    validate_emails_script = os.path.join(script_dir, "validate_emails.py")
-    subprocess.run([
-        "python3",
-        validate_emails_script,
-        "--input_file", processed_file,
-        "--output_file_all", validated_all,
-        "--output_file_valid", validated_good
-    ], check=True)
+    valid_leads = validate_leads(
+        input_file=processed_leads,
+        output_file_all=validated_all if keep_intermediate else None,
+        output_file_valid=validated_good
+    )
 
     # -----------------------------------------------------------------
     # Step 3: Generate GPT Blurbs
     # -----------------------------------------------------------------
     print("Step 3: Generating GPT Blurbs...")
-    personalize_blurbs_script = os.path.join(script_dir, "personalize_blurbs.py")
-    subprocess.run([
-        "python3",
-        personalize_blurbs_script,
-        "--input_file", validated_good,
-        "--output_file", final_output_file
-    ], check=True)
+    generate_customs(
+        input_file=valid_leads,
+        output_file=final_output_file
+    )
 
     print("Pipeline completed successfully!")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python main_pipeline.py <path_to_input_xlsx> <path_to_final_output_xlsx>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Run the full leads pipeline on one input file.")
+    parser.add_argument(
+        "input_file",
+        type=str,
+        help="Path to the input Excel file."
+    )
+    parser.add_argument(
+        "final_output_file",
+        type=str,
+        help="Path to save the final blurbed and classified leads."
+    )
+    parser.add_argument(
+        "--keep-intermediate",
+        action="store_true",
+        help="Also write the step 1 / step 2 intermediate files."
+    )
+    args = parser.parse_args()
 
-    in_file = sys.argv[1]
-    out_file = sys.argv[2]
-    run_pipeline(in_file, out_file)
+    run_pipeline(args.input_file, args.final_output_file, keep_intermediate=args.keep_intermediate)
@@ -1,20 +1,96 @@
 import os
+import json
+import random
 import logging
+import asyncio
+import aiohttp
 import openai
-import pandas as pd
 import time
 import argparse
 
-from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from utils import read_leads, save_json_atomic, write_leads
+
 # Load environment variables from the .env file
 load_dotenv()
 
 # Set the OpenAI API key
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def classify_contact(role, company):
+# Max number of OpenAI requests in flight at once
+MAX_CONCURRENT_REQUESTS = 100
+
+# Rate limits, timeouts and transient server errors are retried with backoff
+RETRYABLE_OPENAI_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    openai.error.APIError,
+)
+MAX_ATTEMPTS = 6
+
+# -----------------------------------------------------
+# File paths
+# -----------------------------------------------------
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_folder = os.path.join(script_dir, "../data/")
+classification_cache_path = os.path.join(data_folder, "classification_cache.json")
+
+# -----------------------------------------------------
+# Classification cache
+# -----------------------------------------------------
+def load_classification_cache():
+    """
+    Load cached labels as {(role, company): label}. Classification runs at
+    temperature 0, so a label can be reused across runs.
+    """
+    if not os.path.exists(classification_cache_path):
+        return {}
+    try:
+        with open(classification_cache_path, "r") as f:
+            data = json.load(f)
+    except json.JSONDecodeError:
+        logging.warning(f"{classification_cache_path} contains invalid JSON, starting with an empty cache.")
+        return {}
+    # Stored as {company: {role: label}}
+    return {
+        (role, company): label
+        for company, roles in data.items()
+        for role, label in roles.items()
+    }
+
+def save_classification_cache(cache):
+    data = {}
+    for (role, company), label in cache.items():
+        data.setdefault(company, {})[role] = label
+    save_json_atomic(data, classification_cache_path, indent=4)
+
+async def create_chat_completion(prompt, temperature, semaphore, max_attempts=MAX_ATTEMPTS):
+    """
+    Sends a single-message chat completion and returns the reply text.
+    Retryable errors are retried with jittered exponential backoff (1-60s).
+    The semaphore is released while backing off so other requests keep going.
+    """
+    for attempt in range(max_attempts):
+        try:
+            async with semaphore:
+                response = await openai.ChatCompletion.acreate(
+                    model="gpt-4o-mini",  # Example model name; adjust as needed
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature
+                )
+            return response["choices"][0]["message"]["content"].strip()
+        except RETRYABLE_OPENAI_ERRORS as e:
+            if attempt == max_attempts - 1:
+                raise
+            delay = random.uniform(1, min(60, 2 ** (attempt + 1)))
+            logging.warning(f"OpenAI request failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def classify_contact(role, company, semaphore):
     """
     Classifies a single contact into one of the following consulting categories:
     - MANAGEMENT
@@ -36,18 +112,13 @@ def classify_contact(role, company):
     """
 
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",  # Example model name; adjust as needed
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.0
-        )
-        label = response["choices"][0]["message"]["content"].strip()
+        label = await create_chat_completion(prompt, 0.0, semaphore)
         return label
     except Exception as e:
         logging.error(f"Error classifying contact: {e}")
         return "CLASSIFICATION_ERROR"
 
-def generate_blurb(role, company, first_name):
+async def generate_blurb(role, company, first_name, semaphore):
     """
     Generates a personalized blurb for a single contact.
     """
@@ -79,37 +150,62 @@ def generate_blurb(role, company, first_name):
     Based on the recipient's role and company, craft a 2-3 sentence blurb that seamlessly fits into the context of this email, adds value, and encourages engagement. Avoid generic language and tailor it specifically to their industry and position. Ensure the tone remains professional and friendly.
     """
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",  # Example model name; adjust as needed
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
-        blurb = response["choices"][0]["message"]["content"].strip()
+        blurb = await create_chat_completion(prompt, 0.7, semaphore)
         return blurb
     except Exception as e:
         logging.error(f"Error generating blurb: {e}")
         return "Error generating blurb."
 
-def process_row(row):
+async def process_rows(rows, classification_cache, max_concurrency=MAX_CONCURRENT_REQUESTS):
     """
-    Processes a single row, generating a blurb and classification.
+    Generates a (blurb, classification) pair for every row dict (with ROLE,
+    COMPANY and FIRST NAME keys) on one event loop,
+    keeping at most 'max_concurrency' OpenAI requests in flight.
+
+    Identical contacts share one blurb call, and each distinct (role, company)
+    is classified once, skipping pairs already in 'classification_cache'.
+    New labels are added to the cache.
     """
-    role = row.get("ROLE", "")
-    company = row.get("COMPANY", "")
-    first_name = row.get("FIRST", "")
+    # Prompts interpolate these values as text, so key on their text form
+    contacts = [
+        (str(row["ROLE"]), str(row["COMPANY"]), str(row["FIRST NAME"]))
+        for row in rows
+    ]
+    blurb_keys = list(dict.fromkeys(contacts))
+    class_keys = [
+        key for key in dict.fromkeys((role, company) for role, company, _ in contacts)
+        if key not in classification_cache
+    ]
+    logging.info(
+        f"Requesting {len(blurb_keys)} blurbs and {len(class_keys)} classifications "
+        f"for {len(contacts)} rows"
+    )
 
-    try:
-        blurb = generate_blurb(role, company, first_name)
-        classification = classify_contact(role, company)
-        return blurb, classification
-    except Exception as e:
-        logging.error(f"Error processing row: ROLE={role}, COMPANY={company}, FIRST={first_name}, Error: {e}")
-        return "Error generating blurb", "CLASSIFICATION_ERROR"
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async with aiohttp.ClientSession() as session:
+        openai.aiosession.set(session)
+        blurbs, labels = await asyncio.gather(
+            asyncio.gather(*(generate_blurb(role, company, first, semaphore) for role, company, first in blurb_keys)),
+            asyncio.gather(*(classify_contact(role, company, semaphore) for role, company in class_keys))
+        )
+
+    blurb_by_contact = dict(zip(blurb_keys, blurbs))
+    new_labels = dict(zip(class_keys, labels))
+    # Don't cache failures, so they are retried next run
+    classification_cache.update(
+        (key, label) for key, label in new_labels.items() if label != "CLASSIFICATION_ERROR"
+    )
+    labels = {**classification_cache, **new_labels}
+    return [
+        (blurb_by_contact[contact], labels[contact[:2]])
+        for contact in contacts
+    ]
 
 def generate_customs(input_file, output_file, debug=False):
     """
-    Loads leads from an Excel file, generates personalized blurbs,
-    classifies consulting groups, and saves the results to a new Excel file.
+    Loads leads from an Excel file (or takes a DataFrame), generates
+    personalized blurbs, classifies consulting groups, and saves the
+    results to a new Excel file. Returns the resulting DataFrame.
     """
     # Set up logging
     log_level = logging.DEBUG if debug else logging.INFO
@@ -119,26 +215,25 @@ def generate_customs(input_file, output_file, debug=False):
 
     # Load leads from Excel
     try:
-        leads = pd.read_excel(input_file)
+        leads = read_leads(input_file)
         total_rows = len(leads)
-        logging.info(f"Loaded {total_rows} leads from {input_file}")
+        logging.info(f"Loaded {total_rows} leads")
     except Exception as e:
         logging.error(f"Failed to read Excel file {input_file}: {e}")
         return
 
-    # Prepare columns for results
-    leads["GPT_BLURB"] = ""
-    leads["CONSULTING_GROUP"] = ""
-
     # Start processing with timing
     start_time = time.time()
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = list(executor.map(process_row, [row for _, row in leads.iterrows()]))
+    # Only these columns feed the prompts; missing ones default to blank
+    records = leads.reindex(columns=["ROLE", "COMPANY", "FIRST NAME"], fill_value="").to_dict("records")
+
+    classification_cache = load_classification_cache()
+    results = asyncio.run(process_rows(records, classification_cache))
+    save_classification_cache(classification_cache)
 
-    # Assign results back to the DataFrame
-    for idx, (blurb, classification) in enumerate(results):
-        leads.at[idx, "GPT_BLURB"] = blurb
-        leads.at[idx, "CONSULTING_GROUP"] = classification
+    # Assign results back to the DataFrame, one column at a time
+    leads["GPT_BLURB"] = [blurb for blurb, _ in results]
+    leads["CONSULTING_GROUP"] = [classification for _, classification in results]
 
     # Log runtime
     end_time = time.time()
@@ -147,11 +242,13 @@ def generate_customs(input_file, output_file, debug=False):
 
     # Save the result to Excel
     try:
-        leads.to_excel(output_file, index=False)
+        write_leads(leads, output_file)
         logging.info(f"Blurbed and classified leads saved to {output_file}")
     except Exception as e:
         logging.error(f"Failed to save Excel file {output_file}: {e}")
 
+    return leads
+
 
 # Example usage
 if __name__ == "__main__":
@@ -1,11 +1,15 @@
 import os
+import sqlite3
 import pandas as pd
 import argparse
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from string import Formatter
+
 # -----------------------------------------------------
 # External Utils (imported from elsewhere)
 # -----------------------------------------------------
-from utils import load_email_formats, load_bad_emails
+from utils import load_email_formats, load_bad_emails, read_leads, write_leads, STRING_DTYPE
 
 # -----------------------------------------------------
 # File / Folder Config
@@ -16,57 +20,85 @@ output_folder = os.path.join(root_dir, "../output/")
 logs_folder = os.path.join(root_dir, "../logs/")
 data_folder = os.path.join(root_dir, "../data/")
 processed_log = os.path.join(logs_folder, "processed_files.log")
+processed_db = os.path.join(logs_folder, "processed.db")
 merged_output_file = os.path.join(output_folder, "master_leads.xlsx")
 
 # -----------------------------------------------------
-# Check if email is in bad_emails
+# Processed files tracking
 # -----------------------------------------------------
-def check_against_bad_emails(email, debug=False):
+def open_processed_db(debug=False):
     """
-    Returns True if 'email' is NOT in the bad email set, False otherwise.
+    Open the SQLite table of already-processed file names, creating it on
+    first use and importing any names from the older 'processed_log' file.
     """
-    bad_emails = load_bad_emails()
-    if debug:
-        print(f"[DEBUG] Checking '{email}' against bad emails...")
-    return email not in bad_emails
+    is_new = not os.path.exists(processed_db)
+    conn = sqlite3.connect(processed_db)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS processed ("
+        "name TEXT PRIMARY KEY, ts TEXT DEFAULT CURRENT_TIMESTAMP)"
+    )
+    if is_new and os.path.exists(processed_log):
+        with open(processed_log, "r") as log_file:
+            names = [(line.strip(),) for line in log_file if line.strip()]
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO processed (name) VALUES (?)", names)
+        if debug:
+            print(f"[DEBUG] Imported {len(names)} entries from '{processed_log}'")
+    return conn
 
 # -----------------------------------------------------
 # Clean a single dataset
 # -----------------------------------------------------
+# Lowercased copies of the mandatory fields, left by clean_data for
+# guess_emails (which removes them again)
+LOWERCASE_COLUMNS = {"FIRST NAME": "_FIRST_LC", "LAST NAME": "_LAST_LC", "COMPANY": "_COMPANY_LC"}
+
 def clean_data(df, debug=False):
     """
-    Clean and normalize data. Modifies 'df' in-place and returns it.
+    Clean and normalize data. Returns the cleaned DataFrame.
     - Ensures uppercase column names
     - Removes duplicates
     - Normalizes name/company casing
-    - Drops rows missing mandatory fields
+    - Drops rows missing mandatory fields (or holding only whitespace)
     - Fills remaining empty cells with blank strings
+    - Adds the LOWERCASE_COLUMNS helper columns
     """
     if debug:
         print("[DEBUG] Beginning data cleaning...")
 
-    initial_rows = len(df)
+    mandatory_fields = ["FIRST NAME", "LAST NAME", "COMPANY"]
 
     # Ensure column names are uppercase and trimmed
     df.columns = df.columns.str.strip().str.upper()
 
+    # Hold the fields all the string work below runs on as Arrow strings
+    if STRING_DTYPE:
+        df[mandatory_fields] = df[mandatory_fields].astype(STRING_DTYPE)
+
     # Remove duplicates
-    df.drop_duplicates(subset=["FIRST NAME", "LAST NAME", "COMPANY"], inplace=True)
+    len_before = len(df)
+    df = df.drop_duplicates(subset=mandatory_fields, ignore_index=True)
     if debug:
-        print(f"[DEBUG] Dropped {initial_rows - len(df)} duplicate rows.")
-
-    # Normalize capitalization for names and company
-    df["FIRST NAME"] = df["FIRST NAME"].str.title()
-    df["LAST NAME"]  = df["LAST NAME"].str.title()
-    df["COMPANY"]    = df["COMPANY"].str.title()
-
-    # Drop rows with missing mandatory fields
-    mandatory_fields = ["FIRST NAME", "LAST NAME", "COMPANY"]
-    missing_fields = df[mandatory_fields].isnull().any(axis=1).sum()
-    df.dropna(subset=mandatory_fields, inplace=True)
+        print(f"[DEBUG] Dropped {len_before - len(df)} duplicate rows.")
+
+    # Drop rows with missing or blank mandatory fields before any email work
+    # (one mask for the count and the filter)
+    missing_mask = df[mandatory_fields].isnull().any(axis=1)
+    for col in mandatory_fields:
+        missing_mask |= df[col].str.strip().eq("")
+    missing_fields = int(missing_mask.sum())
+    df = df.loc[~missing_mask].copy()
     if debug:
         print(f"[DEBUG] Dropped {missing_fields} rows with missing mandatory fields.")
 
+    # Normalize capitalization for names and company (surviving rows only).
+    # Lowercase once; guess_emails needs that and title case derives from it.
+    for col in mandatory_fields:
+        lowered = df[col].str.lower()
+        df[LOWERCASE_COLUMNS[col]] = lowered
+        df[col] = lowered.str.title()
+
     # Fill remaining empty cells with blank strings
     df.fillna("", inplace=True)
 
@@ -75,38 +107,140 @@ def clean_data(df, debug=False):
     return df
 
 # -----------------------------------------------------
-# Guess email address
+# Guess email addresses
 # -----------------------------------------------------
-def guess_email(row, email_formats, debug=False):
+# Placeholders an email_formats pattern may use
+PATTERN_FIELDS = {"first", "last", "first_0", "first[0]"}
+
+def compile_email_format(pattern):
     """
-    Generate email address based on:
-    - A known pattern from 'email_formats' if available
-    - Otherwise, a common fallback pattern: first.last@domain.com
+    Parse an email_formats pattern such as "{first[0]}{last}@airbnb.com" once
+    into a tuple of (literal, field) parts, so applying it is plain string
+    concatenation. Raises ValueError for unsupported placeholders.
     """
-    first = row["FIRST NAME"].lower()
-    last  = row["LAST NAME"].lower()
-    company = row["COMPANY"].lower().replace(" ", "")  # Remove spaces from company name
-    domain  = f"{company}.com"
-
-    # Use known pattern if available
-    if domain in email_formats:
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(pattern):
+        if field is not None and (spec or conversion or field not in PATTERN_FIELDS):
+            raise ValueError(f"unsupported placeholder '{{{field}}}' in '{pattern}'")
+        parts.append((literal, field))
+    return tuple(parts)
+
+def compile_email_formats(email_formats, debug=False):
+    """
+    Compile {domain: pattern} into {domain: (local_template, parts, suffix)},
+    splitting e.g. "{first}.{last}@acme.com" into the local template
+    "{first}.{last}", its compiled parts and the literal suffix "@acme.com".
+    Domains whose pattern can't be compiled are left out and get the
+    generic fallback.
+    """
+    compiled = {}
+    for domain, pattern in email_formats.items():
+        local, at, mail_domain = pattern.rpartition("@")
+        if not at or "{" in mail_domain or "}" in mail_domain:
+            local, mail_domain = pattern, None
         try:
-            known_pattern = email_formats[domain]
+            parts = compile_email_format(local)
+        except ValueError as e:
             if debug:
-                print(f"[DEBUG] Found known pattern '{known_pattern}' for '{domain}'")
-            return known_pattern.format(
-                first=first,
-                last=last,
-                first_0=first[0] if first else ""
-            )
-        except Exception as e:
-            if debug:
-                print(f"[DEBUG] Error applying known pattern for {domain}: {e}")
+                print(f"[DEBUG] Skipping known pattern for {domain}: {e}")
+            continue
+        compiled[domain] = (local, parts, f"@{mail_domain}" if mail_domain is not None else "")
+    return compiled
+
+def _apply_email_format(parts, first, last):
+    """
+    Column-wise equivalent of pattern.format(first=..., last=..., first_0=...)
+    for compiled 'parts'. 'first' and 'last' are lowercased name Series.
+    """
+    first_0 = first.str[:1]
+    fields = {"first": first, "last": last, "first_0": first_0, "first[0]": first_0}
+    result = ""
+    for literal, field in parts:
+        result = result + literal
+        if field is not None:
+            result = result + fields[field]
+    return result
+
+def guess_emails(leads, compiled_formats, debug=False):
+    """
+    Generate an email address for every row of 'leads' based on:
+    - A known pattern from 'compiled_formats' (see compile_email_formats)
+    - Otherwise, a common fallback pattern: first.last@domain.com
+    Works on whole columns and returns a Series aligned with 'leads'.
+    Uses (and removes) the lowercase helper columns from clean_data.
+    """
+    lowered = {
+        col: leads.pop(lc_col) if lc_col in leads else leads[col].str.lower()
+        for col, lc_col in LOWERCASE_COLUMNS.items()
+    }
+    first = lowered["FIRST NAME"]
+    last  = lowered["LAST NAME"]
+    company = lowered["COMPANY"].str.replace(" ", "", regex=False)  # Remove spaces from company name
+    domain  = company + ".com"
+
+    # Start from the generic pattern for every row
+    emails = first + "." + last + "@" + domain
+
+    # Use known pattern if available. Many domains share a local pattern
+    # (e.g. "{first}.{last}"), so do one vectorized pass per distinct one.
+    known = domain[domain.isin(compiled_formats.keys())]
+    local_template = known.map({d: template for d, (template, _, _) in compiled_formats.items()})
+    suffix = known.map({d: suffix for d, (_, _, suffix) in compiled_formats.items()})
+    parts_by_template = {template: parts for template, parts, _ in compiled_formats.values()}
+    for template, index in local_template.groupby(local_template).groups.items():
+        emails.loc[index] = _apply_email_format(
+            parts_by_template[template], first.loc[index], last.loc[index]
+        ) + suffix.loc[index]
+        if debug:
+            print(f"[DEBUG] Applied known pattern '{template}' to {len(index)} rows")
+
+    if debug:
+        print(f"[DEBUG] No known pattern for {len(leads) - len(known)} rows. Used fallback 'first.last@domain'")
+    return emails
+
+# -----------------------------------------------------
+# Process a single input file
+# -----------------------------------------------------
+def _process_one(file_name, input_folder, output_folder, compiled_formats, bad_emails, save_processed=True, debug=False):
+    """
+    Load, clean and guess emails for one input file, excluding 'bad_emails'.
+    Returns the processed leads. Runs in a worker process when several files
+    are pending, and in the calling process for a single file.
+    """
+    input_file = os.path.join(input_folder, file_name)
+    if debug:
+        print(f"[DEBUG] Processing '{input_file}'...")
+
+    # Load dataset
+    leads = read_leads(input_file)
+
+    # Clean data
+    leads = clean_data(leads, debug=debug)
+
+    # Guess emails
+    leads["EMAIL"] = guess_emails(leads, compiled_formats, debug=debug)
 
-    # Fall back to generic pattern
+    # Check against bad emails. isin hashes all of 'bad_emails' into a new
+    # table on every call, so once the bad list outgrows the file it is
+    # cheaper to probe the prebuilt frozenset once per lead.
+    if len(bad_emails) > len(leads):
+        valid_mask = ~leads["EMAIL"].map(bad_emails.__contains__).astype(bool)
+    else:
+        valid_mask = ~leads["EMAIL"].isin(bad_emails)
+    leads = leads[valid_mask]
     if debug:
-        print(f"[DEBUG] No known pattern for '{domain}'. Using fallback 'first.last@{domain}'")
-    return f"{first}.{last}@{domain}"
+        print(f"[DEBUG] {sum(~valid_mask)} leads removed due to bad emails.")
+        print(f"[DEBUG] {len(leads)} valid leads remain in '{file_name}'.")
+
+    # Save processed leads (an intermediate, so Parquet rather than Excel)
+    if save_processed:
+        base_name = os.path.splitext(file_name)[0]
+        output_file = os.path.join(output_folder, f"processed_{base_name}.parquet")
+        write_leads(leads, output_file)
+        if debug:
+            print(f"[DEBUG] Processed leads saved to '{output_file}'")
+
+    return leads
 
 # -----------------------------------------------------
 # Process all input files
@@ -116,16 +250,23 @@ def process_all_leads(
     single_file_name,
     output_folder, 
     merged_output_file=None, 
+    save_processed=True,
+    reprocess=False,
     debug=False
 ):
     """
-    Process all Excel files in 'input_folder':
-      - Skips already-processed files logged in 'processed_log'
+    Process all Excel files in 'input_folder' (only 'single_file_name',
+    if given), one worker process per file:
+      - Skips already-processed files recorded in 'processed_db'
+        (unless 'reprocess' is True)
       - Cleans data
       - Guesses emails
       - Excludes known bad emails
-      - Saves processed leads individually
+      - Saves processed leads individually (unless 'save_processed' is False)
       - Optionally merges all leads into 'merged_output_file'
+
+    Returns the leads processed in this call as a single DataFrame,
+    or None if no file was processed.
     """
     if debug:
         print("[DEBUG] Ensuring output and log folders exist...")
@@ -133,14 +274,9 @@ def process_all_leads(
     os.makedirs(output_folder, exist_ok=True)
     os.makedirs(logs_folder, exist_ok=True)
 
-    # Track all cleaned leads for optional merging
-    all_leads = []
-
-    # Load processed files log
-    processed_files = set()
-    if os.path.exists(processed_log):
-        with open(processed_log, "r") as log_file:
-            processed_files = set(line.strip() for line in log_file)
+    # Load processed files
+    processed_conn = open_processed_db(debug=debug)
+    processed_files = {name for (name,) in processed_conn.execute("SELECT name FROM processed")}
 
     # Load email formats
     email_formats_path = os.path.join(data_folder, "email_formats.json")
@@ -150,82 +286,90 @@ def process_all_leads(
             print(f"[DEBUG] Loaded email formats for {len(email_formats)} domains.")
         else:
             print("[DEBUG] No email formats loaded or file not found.")
+    compiled_formats = compile_email_formats(email_formats, debug=debug)
 
-    # Process each file in the input folder
-    for file_name in os.listdir(input_folder):
-        # Skip temporary and invalid files
-        if file_name.startswith("~$"):
-            if debug:
-                print(f"[DEBUG] Skipping temporary file: {file_name}")
-            continue
-        
-        if file_name != single_file_name:
-            if debug:
-                print(f"[DEBUG] Skipping '{file_name}' since only '{single_file_name}' was specified.")
-            continue
-
-
-        if file_name.endswith(".xlsx") and file_name not in processed_files:
-            input_file = os.path.join(input_folder, file_name)
-            if debug:
-                print(f"[DEBUG] Processing '{input_file}'...")
-            try:
-                # Load dataset
-                leads = pd.read_excel(input_file)
-
-                # Clean data
-                leads = clean_data(leads, debug=debug)
-
-                # Guess emails
-                leads["EMAIL"] = leads.apply(
-                    lambda row: guess_email(row, email_formats, debug=debug),
-                    axis=1
-                )
-
-                # Check against bad emails
-                valid_mask = leads["EMAIL"].apply(
-                    lambda x: check_against_bad_emails(x, debug=debug)
-                )
-                leads = leads[valid_mask]
+    # Load known bad emails once per run, for a single vectorized isin per file
+    bad_emails = frozenset(load_bad_emails())
+    if debug:
+        print(f"[DEBUG] Loaded {len(bad_emails)} known bad emails.")
+
+    # Pick the files to process
+    # (scandir yields the entry type with the name, so no extra stat per file)
+    pending = []
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            file_name = entry.name
+            # Skip temporary and invalid files
+            if file_name.startswith("~$"):
                 if debug:
-                    print(f"[DEBUG] {sum(~valid_mask)} leads removed due to bad emails.")
-                    print(f"[DEBUG] {len(leads)} valid leads remain in '{file_name}'.")
+                    print(f"[DEBUG] Skipping temporary file: {file_name}")
+                continue
 
-                # Save processed leads
-                output_file = os.path.join(output_folder, f"processed_{file_name}")
-                leads.to_excel(output_file, index=False)
+            if single_file_name and file_name != single_file_name:
                 if debug:
-                    print(f"[DEBUG] Processed leads saved to '{output_file}'")
-
-                # Append to 'all_leads' for optional merging
-                all_leads.append(leads)
-
-                # Update processed files log
-                with open(processed_log, "a") as log_file:
-                    log_file.write(f"{file_name}\n")
-
-            except Exception as e:
-                print(f"Error processing file {file_name}: {e}")
+                    print(f"[DEBUG] Skipping '{file_name}' since only '{single_file_name}' was specified.")
+                continue
+
+            if file_name.endswith(".xlsx") and (reprocess or file_name not in processed_files) and entry.is_file():
+                pending.append(file_name)
+
+    # Files are independent, so process them in parallel across cores.
+    # A single file (the run_pipeline case) isn't worth spawning a worker
+    # process and re-importing pandas for, so it runs in this process.
+    if len(pending) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(pending)))
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+    results = {}
+    try:
+        with executor:
+            futures = {
+                executor.submit(
+                    _process_one, file_name, input_folder, output_folder,
+                    compiled_formats, bad_emails, save_processed, debug
+                ): file_name
+                for file_name in pending
+            }
+            for future in as_completed(futures):
+                file_name = futures[future]
+                try:
+                    results[file_name] = future.result()
+                except Exception as e:
+                    print(f"Error processing file {file_name}: {e}")
+                    continue
+
+                # Record the file as processed (one small transaction, only this process writes)
+                with processed_conn:
+                    processed_conn.execute("INSERT OR IGNORE INTO processed (name) VALUES (?)", (file_name,))
+    finally:
+        processed_conn.close()
+
+    # Collect cleaned leads for optional merging, in directory order
+    all_leads = [results[file_name] for file_name in pending if file_name in results]
+    if not all_leads:
+        return None
+    combined_leads = pd.concat(all_leads, ignore_index=True)
 
     # Merge all leads into a single file (if specified)
-    if merged_output_file and all_leads:
+    if merged_output_file:
         if debug:
             print("[DEBUG] Merging all processed leads into a single file...")
-        merged_leads = pd.concat(all_leads, ignore_index=True)
-        initial_merged_rows = len(merged_leads)
 
-        # Remove duplicates across all files
-        merged_leads.drop_duplicates(
-            subset=["FIRST NAME", "LAST NAME", "COMPANY", "EMAIL"],
-            inplace=True
+        # Remove duplicates across all files. drop_duplicates factorizes each
+        # subset column in C and dedupes the combined integer codes, which
+        # measured faster than a joined-string or hash_pandas_object key.
+        merged_leads = combined_leads.drop_duplicates(
+            subset=["FIRST NAME", "LAST NAME", "COMPANY", "EMAIL"], ignore_index=True
         )
         if debug:
-            print(f"[DEBUG] Dropped {initial_merged_rows - len(merged_leads)} duplicates during merge.")
+            print(f"[DEBUG] Dropped {len(combined_leads) - len(merged_leads)} duplicates during merge.")
 
-        merged_leads.to_excel(merged_output_file, index=False)
+        write_leads(merged_leads, merged_output_file)
         if debug:
             print(f"[DEBUG] All leads merged and saved to '{merged_output_file}'")
 
+    return combined_leads
+
 # -----------------------------------------------------
 # Main Function
 # -----------------------------------------------------
@@ -237,6 +381,11 @@ if __name__ == "__main__":
         default="../input/test_leads.xlsx",
         help="Path to the input Excel file."
     )
+    parser.add_argument(
+        "--all_files",
+        action="store_true",
+        help="Process every unprocessed Excel file in the input file's folder."
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -244,19 +393,14 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
-    # We'll derive the folder from whichever file was passed in
-    # so that process_all_leads only processes that one file
+    # We'll derive the folder from whichever file was passed in. Only that
+    # file is processed, unless --all_files asks for every unprocessed
+    # Excel file in the folder.
     input_folder = os.path.dirname(args.input_file)
-    single_file_name = os.path.basename(args.input_file)
+    single_file_name = None if args.all_files else os.path.basename(args.input_file)
 
     print(f"Processing leads from file: {args.input_file}")
 
-    # IMPORTANT: We'll call 'process_all_leads' but skip everything not matching 'single_file_name'.
-    # That way, it won't pick up other xlsx files from input_folder.
-    # If you truly only want to handle the SINGLE file passed in, add a quick check in the for-loop inside 'process_all_leads'.
-    # We'll do that by passing the folder, but keep in mind we only want `single_file_name`.
-    # If you'd like to adapt 'process_all_leads' to accept a single-file path, you can do so too.
-
     process_all_leads(
         input_folder=input_folder,
         single_file_name=single_file_name,
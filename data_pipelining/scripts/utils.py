@@ -1,29 +1,74 @@
 import json
 import os
+import tempfile
+import pandas as pd
+
+from functools import lru_cache
+
+# Use the Rust-based calamine reader when python-calamine is installed;
+# it parses XLSX several times faster than the default openpyxl engine.
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = None
+
+# Likewise write Excel output with xlsxwriter when it is installed; it is
+# considerably faster and lighter on memory than openpyxl. URL-looking
+# values stay plain strings, as they would with openpyxl.
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_WRITE_ENGINE = "xlsxwriter"
+    EXCEL_WRITE_KWARGS = {"options": {"strings_to_urls": False}}
+except ImportError:
+    EXCEL_WRITE_ENGINE = None
+    EXCEL_WRITE_KWARGS = None
+
+# With pyarrow installed, text columns can be held as Arrow-backed strings,
+# whose strip/lower/title/concat and dedupe kernels run in C++ rather than
+# once per Python object.
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = None
 
 # Define the paths for the data folder
 data_folder = os.path.join(os.path.dirname(__file__), "../data/")
 bad_emails_file = os.path.join(data_folder, "bad_emails.json")
 email_formats_file = os.path.join(data_folder, "email_formats.json")
 
-def load_email_formats(filepath=email_formats_file):
+@lru_cache(maxsize=8)
+def _load_json(filepath, mtime):
     """
-    Load static email formats from a JSON file.
+    Parse a JSON file. Keyed on the file's modification time as well, so
+    edits made by other processes are picked up on the next call.
     """
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Email formats file not found: {filepath}")
     with open(filepath, "r") as f:
         return json.load(f)
 
+def load_email_formats(filepath=email_formats_file):
+    """
+    Load static email formats from a JSON file.
+    The result is cached and shared; treat it as read-only.
+    """
+    try:
+        mtime = os.path.getmtime(filepath)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Email formats file not found: {filepath}") from None
+    return _load_json(filepath, mtime)
+
 def load_bad_emails(filepath=bad_emails_file):
     """
     Load the list of bad emails from a JSON file.
+    The result is cached and shared; treat it as read-only.
     """
-    if not os.path.exists(filepath):
+    try:
+        mtime = os.path.getmtime(filepath)
+    except FileNotFoundError:
         print(f"Warning: Bad emails file not found. Returning an empty dictionary.")
         return {}
-    with open(filepath, "r") as f:
-        return json.load(f)
+    return _load_json(filepath, mtime)
 
 def save_bad_emails(bad_emails, filepath=bad_emails_file):
     """
@@ -31,3 +76,47 @@ def save_bad_emails(bad_emails, filepath=bad_emails_file):
     """
     with open(filepath, "w") as f:
         json.dump(bad_emails, f, indent=4)
+    # mtime granularity can hide a quick rewrite, so drop cached copies
+    _load_json.cache_clear()
+
+def save_json_atomic(data, filepath, **dump_kwargs):
+    """
+    Write 'data' as JSON to a temp file next to 'filepath', then rename it
+    over 'filepath', so a concurrent reader never sees a half-written file.
+    """
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=dir_name, suffix=".tmp", delete=False) as f:
+        try:
+            json.dump(data, f, **dump_kwargs)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, filepath)
+
+def read_leads(source):
+    """
+    Return leads as a DataFrame. 'source' may be a path to an Excel or
+    Parquet file, or a DataFrame handed over from a previous pipeline step.
+    """
+    if isinstance(source, pd.DataFrame):
+        return source
+    if source.endswith(".parquet"):
+        return pd.read_parquet(source)
+    return pd.read_excel(source, engine=EXCEL_READ_ENGINE)
+
+def write_leads(df, path):
+    """
+    Save leads to 'path'. Intermediate files use Parquet (.parquet), which
+    is much faster to write and read back; anything else is written as Excel.
+    """
+    if path.endswith(".parquet"):
+        # clean_data's fillna("") leaves numeric columns with blanks as
+        # object columns mixing floats and "", which Parquet can't store
+        object_columns = df.columns[df.dtypes == object]
+        if len(object_columns):
+            df = df.astype({column: "string" for column in object_columns})
+        df.to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False, engine=EXCEL_WRITE_ENGINE, engine_kwargs=EXCEL_WRITE_KWARGS)
@@ -1,109 +1,203 @@
 import os
+import re
 import json
-import requests
+import sqlite3
+import random
+import time
+import asyncio
+import aiohttp
 import pandas as pd
 import argparse
 
-from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from functools import lru_cache
+from string import Formatter
 from dotenv import load_dotenv
 
+from utils import load_bad_emails, load_email_formats, read_leads, save_json_atomic, write_leads
+
 # Load environment variables from the .env file
 load_dotenv()
 
-# Set the OpenAI API key
+# Set the MillionVerifier API key
 mv_api_key = os.getenv("MILLION_VERIFIER_API_KEY")
 
+# Max MillionVerifier requests in flight at once
+MAX_CONCURRENT_REQUESTS = 100
+
+# Per-request timeout for MillionVerifier calls
+MV_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# HTTP statuses worth retrying (rate limiting, transient server errors);
+# any other error status won't change on a retry
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# MV result codes that are a verdict on the address itself (ok, catch-all,
+# disposable, invalid). Unknown (3) and error (4) answers may change on a
+# later call, so they are never cached.
+CACHEABLE_RESULTCODES = {1, 2, 5, 6}
+
+# Seconds a cached MV verdict is trusted before the address is checked again
+VERIFY_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Cheap syntax check for candidate addresses, so ones that can't be valid
+# (spaces in a name, empty company, ...) never cost an API call
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
 # -----------------------------------------------------
 # File paths
 # -----------------------------------------------------
 script_dir = os.path.dirname(os.path.abspath(__file__))
 data_folder = os.path.join(script_dir, "../data/")
-bad_emails_path = os.path.join(data_folder, "bad_emails.json")
-email_formats_path = os.path.join(data_folder, "email_formats.json")
 dynamic_db_path = os.path.join(data_folder, "dynamic_email_format_db.json")
+dynamic_sqlite_path = os.path.join(data_folder, "dynamic_email_format_db.db")
+verify_cache_path = os.path.join(data_folder, "verify_cache.json")
 
 # -----------------------------------------------------
 # Load / Save Helpers
 # -----------------------------------------------------
-def load_bad_emails(debug=False):
-    if os.path.exists(bad_emails_path):
-        with open(bad_emails_path, "r") as f:
-            bads = set(json.load(f))
-            if debug:
-                print(f"[DEBUG] Loaded {len(bads)} bad emails from {bad_emails_path}")
-            return bads
-    if debug:
-        print(f"[DEBUG] No {bad_emails_path} found, returning empty set of bad emails.")
-    return set()
-
-def load_email_formats(debug=False):
-    if os.path.exists(email_formats_path):
-        with open(email_formats_path, "r") as f:
-            data = json.load(f)
-            if debug:
-                print(f"[DEBUG] Loaded email formats for {len(data)} domains from {email_formats_path}")
-            return data
-    if debug:
-        print(f"[DEBUG] No {email_formats_path} found, returning empty dict.")
-    return {}
-
 def load_dynamic_db(debug=False):
-    if os.path.exists(dynamic_db_path):
+    try:
         with open(dynamic_db_path, "r") as f:
             content = f.read().strip()
-            if not content:
-                # File is empty
-                if debug:
-                    print(f"[DEBUG] {dynamic_db_path} is empty, returning empty dynamic DB.")
-                return {}
-            try:
-                db = json.loads(content)
-                if debug:
-                    print(f"[DEBUG] Loaded dynamic DB with {len(db.keys())} domains from {dynamic_db_path}")
-                return db
-            except json.JSONDecodeError:
-                if debug:
-                    print(f"[DEBUG] {dynamic_db_path} contains invalid JSON, returning empty dynamic DB.")
-                return {}
+    except FileNotFoundError:
+        if debug:
+            print(f"[DEBUG] No {dynamic_db_path} found, returning empty dynamic DB.")
+        return {}
+    if not content:
+        # File is empty
+        if debug:
+            print(f"[DEBUG] {dynamic_db_path} is empty, returning empty dynamic DB.")
+        return {}
+    try:
+        db = json.loads(content)
+    except json.JSONDecodeError:
+        if debug:
+            print(f"[DEBUG] {dynamic_db_path} contains invalid JSON, returning empty dynamic DB.")
+        return {}
     if debug:
-        print(f"[DEBUG] No {dynamic_db_path} found, returning empty dynamic DB.")
-    return {}
+        print(f"[DEBUG] Loaded dynamic DB with {len(db.keys())} domains from {dynamic_db_path}")
+    return db
 
-def save_dynamic_db(db, debug=False):
+def open_dynamic_db(debug=False):
+    """
+    Open the SQLite dynamic DB (pattern usage per domain and known catch-all
+    domains), creating it on first use and importing the older JSON
+    dynamic DB. Changes are committed as they happen.
+    """
     os.makedirs(data_folder, exist_ok=True)
-    with open(dynamic_db_path, "w") as f:
-        json.dump(db, f, indent=4)
+    is_new = not os.path.exists(dynamic_sqlite_path)
+    conn = sqlite3.connect(dynamic_sqlite_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS usage ("
+        "domain TEXT, pattern TEXT, count INTEGER NOT NULL, PRIMARY KEY (domain, pattern))"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS catchall (domain TEXT PRIMARY KEY)")
+    if is_new:
+        db = load_dynamic_db(debug=debug)
+        usage_rows = [
+            (domain, pattern_key, count)
+            for domain, counts in db.items() if not domain.startswith("_")
+            for pattern_key, count in counts.items()
+        ]
+        catchall_rows = [(domain,) for domain, flag in db.get("_catchall_domains", {}).items() if flag]
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO usage VALUES (?, ?, ?)", usage_rows)
+            conn.executemany("INSERT OR IGNORE INTO catchall VALUES (?)", catchall_rows)
+        if debug:
+            print(f"[DEBUG] Imported {len(usage_rows)} usage counts and {len(catchall_rows)} catch-all domains into {dynamic_sqlite_path}")
+    return conn
+
+def load_verify_cache(debug=False):
+    """
+    Load MillionVerifier responses saved by earlier runs, keyed on email, as
+    {"result": response, "checked": timestamp}. Entries older than
+    VERIFY_CACHE_TTL (or without a timestamp) are dropped.
+    """
+    try:
+        with open(verify_cache_path, "r") as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        if debug:
+            print(f"[DEBUG] No {verify_cache_path} found, returning empty cache.")
+        return {}
+    except json.JSONDecodeError:
+        if debug:
+            print(f"[DEBUG] {verify_cache_path} contains invalid JSON, returning empty cache.")
+        return {}
+    oldest = time.time() - VERIFY_CACHE_TTL
+    cache = {
+        email: entry for email, entry in stored.items()
+        if isinstance(entry, dict) and entry.get("checked", 0) > oldest
+    }
     if debug:
-        print(f"[DEBUG] Saved dynamic DB with {len(db.keys())} domains to {dynamic_db_path}")
+        print(f"[DEBUG] Loaded {len(cache)} cached MV results from {verify_cache_path} ({len(stored) - len(cache)} expired)")
+    return cache
+
+def save_verify_cache(cache, debug=False):
+    save_json_atomic(cache, verify_cache_path)
+    if debug:
+        print(f"[DEBUG] Saved {len(cache)} cached MV results to {verify_cache_path}")
 
 # -----------------------------------------------------
 # MillionVerifier
 # -----------------------------------------------------
-def verify_email_millionverifier(email, api_key=mv_api_key, retries=3, debug=False):
+async def verify_email_millionverifier(session, email, api_key=mv_api_key, retries=3, debug=False):
     for attempt in range(retries):
         try:
             if debug:
                 print(f"[DEBUG] Attempt {attempt+1} to verify '{email}' via MillionVerifier...")
 
-            response = requests.get(
+            async with session.get(
                 "https://api.millionverifier.com/api/v3/",
-                params={"api": api_key, "email": email},
-                timeout=10
-            )
-            response.raise_for_status()
-            data = response.json()
+                params={"api": api_key or "", "email": email}
+            ) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
 
             if debug:
                 print(f"[DEBUG] MillionVerifier response for '{email}': {data}")
 
             return data
         except Exception as e:
+            if isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRYABLE_STATUSES:
+                if debug:
+                    print(f"[DEBUG] MillionVerifier returned {e.status} for '{email}', not retrying")
+                return None
             if debug:
                 print(f"[DEBUG] Error verifying '{email}': {e}")
             if attempt == retries - 1:
                 if debug:
                     print(f"[DEBUG] All {retries} attempts failed for '{email}'")
                 return None
+            # Exponential backoff with jitter so retries from many leads
+            # don't all land at once; the connection is free while waiting
+            await asyncio.sleep(random.uniform(1, 2 ** (attempt + 1)))
+
+async def verify_email_cached(session, email, verify_cache, in_flight, debug=False):
+    """
+    Return the MV response for 'email', calling the API only the first time
+    an address is seen. Concurrent probes of the same address share the one
+    request tracked in 'in_flight' (email -> task). Only definitive answers
+    (CACHEABLE_RESULTCODES, no error) are cached; failed lookups, unknown
+    results and API errors are retried on the next run.
+    """
+    if email in verify_cache:
+        if debug:
+            print(f"[DEBUG] Using cached MV result for '{email}'")
+        return verify_cache[email]["result"]
+    task = in_flight.get(email)
+    if task is None:
+        task = asyncio.ensure_future(verify_email_millionverifier(session, email, debug=debug))
+        in_flight[email] = task
+    elif debug:
+        print(f"[DEBUG] Waiting on in-flight MV lookup for '{email}'")
+    data = await task
+    in_flight.pop(email, None)
+    if data and data.get("resultcode") in CACHEABLE_RESULTCODES and not data.get("error"):
+        verify_cache[email] = {"result": data, "checked": time.time()}
+    return data
 
 # -----------------------------------------------------
 # Known fallback patterns
@@ -115,68 +209,114 @@ FALLBACK_PATTERNS = {
     "firstInitial.last":"{firstInitial}.{last}"
 }
 
+# Fallback pattern key by its template, for matching email_formats patterns
+FALLBACK_BY_TEMPLATE = {tpl: key for key, tpl in FALLBACK_PATTERNS.items()}
+
+def fallback_prefix_columns(first, last):
+    """
+    Build every FALLBACK_PATTERNS prefix for whole columns of lowercased
+    names at once. Returns a DataFrame with one column per pattern key.
+    """
+    fields = {"first": first, "last": last, "firstInitial": first.str[:1]}
+    columns = {}
+    for pattern_key, template in FALLBACK_PATTERNS.items():
+        prefix = ""
+        for literal, field, _, _ in Formatter().parse(template):
+            prefix = prefix + literal
+            if field is not None:
+                prefix = prefix + fields[field]
+        columns[pattern_key] = prefix
+    return pd.DataFrame(columns, index=first.index)
+
+@lru_cache(maxsize=None)
+def compile_prefix_template(template):
+    """
+    Turn a prefix template such as "{first[0]}{last}" into the %-format
+    string "%(firstInitial)s%(last)s" once, so applying it per lead is a
+    single '%' instead of re-parsing the template.
+    """
+    return (template
+            .replace("%", "%%")
+            .replace("{first[0]}", "%(firstInitial)s")
+            .replace("{first_0}", "%(firstInitial)s")
+            .replace("{firstInitial}", "%(firstInitial)s")
+            .replace("{first}", "%(first)s")
+            .replace("{last}", "%(last)s"))
+
+@lru_cache(maxsize=None)
+def compile_pattern_key(pattern_key):
+    """
+    Return the %-format string for a pattern key (a FALLBACK_PATTERNS key
+    or "customPattern:xxxx"), or None if it is neither. Each key is only
+    looked up and compiled once per process.
+    """
+    if pattern_key in FALLBACK_PATTERNS:
+        return compile_prefix_template(FALLBACK_PATTERNS[pattern_key])
+    if pattern_key.startswith("customPattern:"):
+        return compile_prefix_template(pattern_key[len("customPattern:"):])
+    return None
+
 def apply_pattern(pattern_key, first, last, debug=False):
     """
     Convert a pattern key into the actual email prefix.
     - If it's one of our known fallback patterns, apply it directly.
     - If it's "customPattern:xxxx", treat that as a custom .format(...) template.
     """
-    firstInitial = first[:1] if first else ""
-    if pattern_key in FALLBACK_PATTERNS:
-        template = FALLBACK_PATTERNS[pattern_key]
-        prefix = template.format(first=first, last=last, firstInitial=firstInitial)
-        if debug:
-            print(f"[DEBUG] Applying fallback pattern '{pattern_key}' -> '{prefix}'")
-        return prefix
-
-    if pattern_key.startswith("customPattern:"):
-        custom_template = pattern_key[len("customPattern:"):]
-        prefix = (custom_template
-                  .replace("{first[0]}", firstInitial)
-                  .replace("{first_0}", firstInitial)
-                  .replace("{first}", first)
-                  .replace("{last}", last))
-        if debug:
-            print(f"[DEBUG] Applying custom pattern '{pattern_key}' -> '{prefix}'")
-        return prefix
+    fmt = compile_pattern_key(pattern_key)
+    if fmt is None:
+        return ""
+    prefix = fmt % {"first": first, "last": last, "firstInitial": first[:1]}
+    if debug:
+        print(f"[DEBUG] Applying pattern '{pattern_key}' -> '{prefix}'")
+    return prefix
 
-    return ""
+def load_domain_usage(db, domain):
+    """
+    Return a domain's stored pattern usage as a Counter, in the order the
+    patterns were first recorded.
+    """
+    return Counter(dict(db.execute(
+        "SELECT pattern, count FROM usage WHERE domain = ? ORDER BY rowid", (domain,)
+    )))
 
-def record_email_usage(db, domain, pattern_key, debug=False):
+def record_email_usage(db, domain, usage, debug=False):
     """
-    Increments usage for a pattern key ONLY for Valid addresses.
+    Add a domain's Valid counts from this run ('usage', a Counter of
+    pattern key -> count) to the dynamic DB.
     """
-    if domain not in db:
-        db[domain] = {}
-    old_val = db[domain].get(pattern_key, 0)
-    db[domain][pattern_key] = old_val + 1
+    if not usage:
+        return
+    with db:
+        db.executemany(
+            "INSERT INTO usage VALUES (?, ?, ?) "
+            "ON CONFLICT (domain, pattern) DO UPDATE SET count = count + excluded.count",
+            [(domain, pattern_key, n) for pattern_key, n in usage.items()]
+        )
     if debug:
-        print(f"[DEBUG] Updated usage for domain '{domain}', pattern '{pattern_key}' from {old_val} -> {old_val+1}")
+        print(f"[DEBUG] Updated usage for domain '{domain}': {dict(usage)}")
 
-def sorted_patterns_by_usage(db, domain, debug=False):
+def sorted_patterns_by_usage(usage_map, domain, debug=False):
     """
-    Return pattern keys for a domain, sorted by usage desc
+    Return a domain's pattern keys from 'usage_map', sorted by usage desc
     """
-    if domain not in db:
+    if not usage_map:
         if debug:
             print(f"[DEBUG] No dynamic patterns for domain '{domain}' yet.")
         return []
-    usage_map = db[domain]
     patterns = sorted(usage_map.keys(), key=lambda p: usage_map[p], reverse=True)
-    # We exclude '_catchall_domains' if it exists in the same top-level dict
+    # Skip any '_'-prefixed bookkeeping keys
     return [p for p in patterns if not p.startswith("_")]
 
-    # If you stored patterns in sub-dicts, you'd adjust accordingly.
-    # This is fine for now.
-
 # -----------------------------------------------------
 # Parsing the static pattern from email_formats.json
 # -----------------------------------------------------
+@lru_cache(maxsize=4096)
 def parse_static_pattern(static_pattern_str, debug=False):
     """
     Example: given "{first[0]}{last}@airbnb.com",
     return "customPattern:{first[0]}{last}" (omitting '@airbnb.com'),
     unless it matches a known fallback exactly.
+    Memoized, since every lead at a domain parses the same pattern.
     """
     parts = static_pattern_str.split("@")
     if len(parts) < 2:
@@ -186,11 +326,11 @@ def parse_static_pattern(static_pattern_str, debug=False):
     prefix_part = parts[0]
 
     # Check if it matches one of our fallback patterns exactly
-    for key, tpl in FALLBACK_PATTERNS.items():
-        if prefix_part == tpl:
-            if debug:
-                print(f"[DEBUG] parse_static_pattern: '{prefix_part}' matched known fallback '{key}'")
-            return key
+    key = FALLBACK_BY_TEMPLATE.get(prefix_part)
+    if key:
+        if debug:
+            print(f"[DEBUG] parse_static_pattern: '{prefix_part}' matched known fallback '{key}'")
+        return key
 
     # Otherwise, it's a custom pattern
     if debug:
@@ -202,63 +342,72 @@ def parse_static_pattern(static_pattern_str, debug=False):
 # -----------------------------------------------------
 def is_domain_catchall(db, domain_key):
     """
-    We store catch-all info in e.g. db["_catchall_domains"] = {domain_key: True, ...}
+    Catch-all domains are rows of the dynamic DB's 'catchall' table.
     """
-    catchall_info = db.get("_catchall_domains", {})
-    return catchall_info.get(domain_key, False)
+    return db.execute("SELECT 1 FROM catchall WHERE domain = ?", (domain_key,)).fetchone() is not None
 
 def mark_domain_catchall(db, domain_key, debug=False):
     """
     Mark domain as catch-all so we can skip future MV calls.
     """
-    if "_catchall_domains" not in db:
-        db["_catchall_domains"] = {}
-    db["_catchall_domains"][domain_key] = True
+    with db:
+        db.execute("INSERT OR IGNORE INTO catchall VALUES (?)", (domain_key,))
     if debug:
         print(f"[DEBUG] Marked domain '{domain_key}' as catch-all in dynamic DB.")
 
+def catchall_placeholder(lead, fallback_prefixes, email_formats, debug=False):
+    """
+    Result for a lead at a known catch-all domain, which we don't verify.
+    The email is built from the static pattern if there is one, else from
+    'first.last'.
+    """
+    first, last, domain_key = lead
+    static_pattern_str = email_formats.get(domain_key, "")
+    prefix = ""
+    if static_pattern_str:
+        parsed_key = parse_static_pattern(static_pattern_str, debug=debug)
+        if parsed_key:
+            prefix = apply_pattern(parsed_key, first, last, debug=debug)
+    else:
+        prefix = fallback_prefixes["first.last"]
+
+    # label row as catch-all
+    return "Catch-All", prefix + "@" + domain_key if prefix else "", None
+
 # -----------------------------------------------------
 # Validation for a single lead
 # -----------------------------------------------------
-def validate_one_lead(row, bad_emails, email_formats, dynamic_db, debug=False):
+async def validate_one_lead(session, lead, fallback_prefixes, bad_emails, email_formats, dynamic_db, usage, verify_cache, in_flight, catchall_learned, debug=False):
     """
     Validate a single lead row with domain-level catch-all optimization:
       - If domain is known catch-all, skip MV calls, just label as Catch-All.
       - Otherwise, proceed with pattern tries.
       - If we find a new catch-all response from MV, mark domain as catch-all.
       - Only record usage for code==1 (Valid).
-    """
-    row["EMAIL STATUS"] = "Invalid"
-    row["VALIDATED EMAIL"] = ""
 
-    first = row["FIRST NAME"].strip().lower()
-    last = row["LAST NAME"].strip().lower()
-    company_key = row["COMPANY"].strip().lower().replace(" ", "")
-    domain_key = f"{company_key}.com"
+    'lead' is a (first, last, domain_key) tuple, already stripped and
+    lowercased (see normalize_leads).
+    'fallback_prefixes' maps each FALLBACK_PATTERNS key to this lead's
+    prefix (see fallback_prefix_columns). 'usage' holds the pattern usage
+    counts for this lead's domain. 'verify_cache' and 'in_flight' are
+    passed through to verify_email_cached. 'catchall_learned' is the set of
+    domains found catch-all during this run; it is checked before every MV
+    call, so leads already in flight stop probing as soon as another lead
+    at their domain comes back Catch-All.
+
+    Returns (email_status, validated_email, pattern_key), where pattern_key
+    is the pattern that came back Valid (else None) for the caller to count.
+    """
+    first, last, domain_key = lead
 
     if debug:
-        print(f"\n[DEBUG] Validating lead for: '{row['FIRST NAME']} {row['LAST NAME']}' (Domain: '{domain_key}')")
+        print(f"\n[DEBUG] Validating lead for: '{first} {last}' (Domain: '{domain_key}')")
 
     # 1) If domain is already known catch-all, skip verifying
-    if is_domain_catchall(dynamic_db, domain_key):
+    if domain_key in catchall_learned or is_domain_catchall(dynamic_db, domain_key):
         if debug:
             print(f"[DEBUG] Domain '{domain_key}' is known catch-all, skipping further MV calls.")
-        # Optionally generate some email if you want a placeholder, e.g. from email_formats or fallback
-        # Let's do the static pattern if available, else fallback
-        static_pattern_str = email_formats.get(domain_key, "")
-        prefix = ""
-        if static_pattern_str:
-            parsed_key = parse_static_pattern(static_pattern_str, debug=debug)
-            if parsed_key:
-                prefix = apply_pattern(parsed_key, first, last, debug=debug)
-        else:
-            # fallback to 'first.last'
-            prefix = f"{first}.{last}"
-
-        # label row as catch-all
-        row["EMAIL STATUS"] = "Catch-All"
-        row["VALIDATED EMAIL"] = prefix + "@" + domain_key if prefix else ""
-        return row
+        return catchall_placeholder(lead, fallback_prefixes, email_formats, debug=debug)
 
     # 2) Build a list of pattern keys to try:
     pattern_keys_to_try = []
@@ -271,45 +420,54 @@ def validate_one_lead(row, bad_emails, email_formats, dynamic_db, debug=False):
             pattern_keys_to_try.append(parsed_key)
 
     # b) Patterns from the dynamic DB, sorted by usage desc
-    dynamic_patterns = sorted_patterns_by_usage(dynamic_db, domain_key, debug=debug)
+    dynamic_patterns = sorted_patterns_by_usage(usage, domain_key, debug=debug)
     pattern_keys_to_try.extend(dynamic_patterns)
 
     # c) Fallback patterns in a fixed order
     fallback_order = ["first", "first.last", "first_{last}", "firstInitial.last"]
-    for fb in fallback_order:
-        if fb not in pattern_keys_to_try:
-            pattern_keys_to_try.append(fb)
+    pattern_keys_to_try.extend(fallback_order)
 
     # Remove duplicates while preserving order
-    seen = {}
-    pattern_keys_cleaned = []
-    for pk in pattern_keys_to_try:
-        if pk not in seen:
-            pattern_keys_cleaned.append(pk)
-            seen[pk] = True
-    pattern_keys_to_try = pattern_keys_cleaned
+    pattern_keys_to_try = list(dict.fromkeys(pattern_keys_to_try))
 
     if debug:
         print(f"[DEBUG] Final pattern list for '{domain_key}': {pattern_keys_to_try}")
 
-    # 3) Try each pattern key in order
+    # 3) Build the candidate emails up front. Different patterns can give
+    # the same address (e.g. for one-letter first names), so keep only its
+    # first pattern, and drop known-bad or malformed addresses before any
+    # MV call.
+    candidates = {}
     for pk in pattern_keys_to_try:
-        prefix = apply_pattern(pk, first, last, debug=debug)
-        if not prefix:
-            continue
+        if pk in fallback_prefixes:
+            prefix = fallback_prefixes[pk]
+        else:
+            prefix = apply_pattern(pk, first, last, debug=debug)
+        if prefix:
+            candidates.setdefault(prefix + "@" + domain_key, pk)
 
-        email_address = prefix + "@" + domain_key
+    for email_address in [e for e in candidates if e in bad_emails]:
         if debug:
-            print(f"[DEBUG] Testing email '{email_address}'")
+            print(f"[DEBUG] '{email_address}' is in bad_emails. Skipping...")
+        del candidates[email_address]
 
-        # Skip if known-bad
-        if email_address in bad_emails:
+    for email_address in [e for e in candidates if not EMAIL_RE.fullmatch(e)]:
+        if debug:
+            print(f"[DEBUG] '{email_address}' is malformed. Skipping...")
+        del candidates[email_address]
+
+    # 4) Try each candidate in order
+    for email_address, pk in candidates.items():
+        if domain_key in catchall_learned:
             if debug:
-                print(f"[DEBUG] '{email_address}' is in bad_emails. Skipping...")
-            continue
+                print(f"[DEBUG] Domain '{domain_key}' was just found catch-all, stopping search.")
+            return catchall_placeholder(lead, fallback_prefixes, email_formats, debug=debug)
+
+        if debug:
+            print(f"[DEBUG] Testing email '{email_address}'")
 
         # Verify with MillionVerifier
-        mv_result = verify_email_millionverifier(email_address, debug=debug)
+        mv_result = await verify_email_cached(session, email_address, verify_cache, in_flight, debug=debug)
         if not mv_result:
             if debug:
                 print(f"[DEBUG] No MV result or final attempt failed for '{email_address}'.")
@@ -318,34 +476,106 @@ def validate_one_lead(row, bad_emails, email_formats, dynamic_db, debug=False):
         code = mv_result.get("resultcode")
         if code == 1:
             # Confirmed Valid
-            row["EMAIL STATUS"] = "Valid"
-            row["VALIDATED EMAIL"] = email_address
-            # record usage only for valid
-            record_email_usage(dynamic_db, domain_key, pk, debug=debug)
             if debug:
                 print(f"[DEBUG] '{email_address}' is Valid. Stopping search.")
-            return row
+            # record usage only for valid
+            return "Valid", email_address, pk
 
         elif code == 2:
             # Found a Catch-All
-            row["EMAIL STATUS"] = "Catch-All"
-            row["VALIDATED EMAIL"] = email_address
-
             # Mark domain so future leads skip verifying
             mark_domain_catchall(dynamic_db, domain_key, debug=debug)
+            catchall_learned.add(domain_key)
 
             if debug:
                 print(f"[DEBUG] '{email_address}' is Catch-All. Stopping search.")
-            return row
+            return "Catch-All", email_address, None
 
         else:
             if debug:
                 print(f"[DEBUG] '{email_address}' returned code '{code}', continuing...")
 
-    # 4) If all fail, remain invalid
+    # 5) If all fail, remain invalid
     if debug:
         print(f"[DEBUG] No valid patterns found for '{first} {last}' at '{domain_key}'. Marking invalid.")
-    return row
+    return "Invalid", "", None
+
+async def validate_all_leads(rows, fallback_rows, bad_emails, email_formats, dynamic_db, verify_cache, concurrency=MAX_CONCURRENT_REQUESTS, debug=False):
+    """
+    Validate every row on one event loop. All MillionVerifier calls share a
+    single connection pool capped at 'concurrency' in-flight requests.
+    'rows' are normalize_leads tuples; 'fallback_rows' holds each row's
+    fallback prefixes as a tuple in FALLBACK_PATTERNS order.
+
+    Leads for the same domain go out in batches of doubling size (1, 2, 4,
+    ...), so catch-all marks and pattern usage learned from earlier batches
+    still apply to later ones, while a domain with N leads takes about
+    log2(N) rounds of round trips instead of N. Up to 'concurrency'
+    domains are worked on at once. Returns an (email_status, validated_email) pair per row,
+    in input order.
+    """
+    by_domain = {}
+    for i, (_, _, domain_key) in enumerate(rows):
+        by_domain.setdefault(domain_key, []).append(i)
+
+    results = [None] * len(rows)
+    in_flight = {}
+    catchall_learned = set()
+
+    async def validate_domain(domain_key, indices):
+        # Each domain's usage is only touched here; this run's Valid counts
+        # are kept apart and written to the dynamic DB once the domain is done
+        usage = load_domain_usage(dynamic_db, domain_key)
+        learned = Counter()
+        start, batch_size = 0, 1
+        while start < len(indices):
+            batch = indices[start:start + batch_size]
+            outcomes = await asyncio.gather(*(
+                validate_one_lead(
+                    session, rows[i], dict(zip(FALLBACK_PATTERNS, fallback_rows[i])),
+                    bad_emails, email_formats, dynamic_db, usage, verify_cache, in_flight, catchall_learned, debug=debug
+                )
+                for i in batch
+            ))
+            # Only update usage between batches, so leads in one batch all
+            # see the same pattern order
+            for i, (status, email_address, pattern_key) in zip(batch, outcomes):
+                results[i] = (status, email_address)
+                if pattern_key:
+                    usage[pattern_key] += 1
+                    learned[pattern_key] += 1
+            start += batch_size
+            batch_size *= 2
+        record_email_usage(dynamic_db, domain_key, learned, debug=debug)
+
+    # Every call goes to the same host, so keep idle connections (and the
+    # resolved address) around long enough to be reused across the run
+    connector = aiohttp.TCPConnector(
+        limit=concurrency, limit_per_host=concurrency,
+        keepalive_timeout=60, ttl_dns_cache=300
+    )
+    # A fixed set of workers pull domains off one shared iterator, rather
+    # than one coroutine per domain all created up front
+    domains = iter(by_domain.items())
+
+    async def worker():
+        for domain_key, indices in domains:
+            await validate_domain(domain_key, indices)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=MV_TIMEOUT) as session:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(by_domain)))))
+    return results
+
+def normalize_leads(leads):
+    """
+    Return stripped, lowercased (first, last, domain_key) Series for
+    'leads', with domain_key built from COMPANY as e.g. "acmecorp.com".
+    """
+    def clean(col):
+        return leads[col].fillna("").astype(str).str.strip().str.lower()
+
+    domain_key = clean("COMPANY").str.replace(" ", "", regex=False) + ".com"
+    return clean("FIRST NAME"), clean("LAST NAME"), domain_key
 
 # -----------------------------------------------------
 # Master Function
@@ -358,65 +588,78 @@ def validate_leads(input_file, output_file_all, output_file_valid, debug=False):
       2) 'output_file_valid': includes ONLY valid or catch-all rows,
          sorted by 'COMPANY'.
 
-    :param input_file: path to the input Excel of leads
-    :param output_file_all: path to save the full validated output
+    Returns the valid/catch-all DataFrame so it can be handed straight
+    to the next pipeline step.
+
+    :param input_file: path to the input leads (.xlsx or .parquet), or a DataFrame
+    :param output_file_all: path to save the full validated output, .parquet or .xlsx (None to skip)
     :param output_file_valid: path to save only the valid/catch-all rows
     :param debug: True or False for debug printing
     """
     if debug:
         print(f"[DEBUG] Beginning validation process.")
-        print(f"[DEBUG] Reading leads from '{input_file}'")
+        if isinstance(input_file, str):
+            print(f"[DEBUG] Reading leads from '{input_file}'")
 
-    leads = pd.read_excel(input_file)
+    leads = read_leads(input_file)
 
     # Load data
-    bad_emails = load_bad_emails(debug=debug)
-    email_formats_data = load_email_formats(debug=debug)
-    dynamic_db = load_dynamic_db(debug=debug)
-
-    # Initialize columns
-    leads["EMAIL STATUS"] = "Invalid"
-    leads["VALIDATED EMAIL"] = ""
+    # Same loaders (and cached copies) as process_leads
+    bad_emails = frozenset(load_bad_emails())
+    try:
+        email_formats_data = load_email_formats()
+    except FileNotFoundError:
+        email_formats_data = {}
+    if debug:
+        print(f"[DEBUG] Loaded {len(bad_emails)} bad emails and email formats for {len(email_formats_data)} domains.")
+    verify_cache = load_verify_cache(debug=debug)
 
-    rows = leads.to_dict("records")
+    # Normalized names/domains and fallback prefixes for every row, built
+    # column-wise in one go
+    first, last, domain_key = normalize_leads(leads)
+    rows = list(zip(first, last, domain_key))
+    fallback_rows = list(fallback_prefix_columns(first, last).itertuples(index=False, name=None))
 
     if debug:
-        print(f"[DEBUG] Beginning parallel validation with up to 10 workers...")
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = list(
-            executor.map(
-                lambda r: validate_one_lead(r, bad_emails, email_formats_data, dynamic_db, debug=debug),
-                rows
-            )
+        print(f"[DEBUG] Beginning async validation with up to {MAX_CONCURRENT_REQUESTS} requests in flight...")
+    dynamic_db = open_dynamic_db(debug=debug)
+    try:
+        results = asyncio.run(
+            validate_all_leads(rows, fallback_rows, bad_emails, email_formats_data, dynamic_db, verify_cache, debug=debug)
         )
+    finally:
+        dynamic_db.close()
 
-    updated_leads = pd.DataFrame(results)
+    leads["EMAIL STATUS"] = [status for status, _ in results]
+    leads["VALIDATED EMAIL"] = [email for _, email in results]
 
     # --- 1) Drop the original "EMAIL" column if it exists ---
-    if "EMAIL" in updated_leads.columns:
-        updated_leads.drop(columns=["EMAIL"], inplace=True)
+    updated_leads = leads.drop(columns=["EMAIL"], errors="ignore")
 
     # --- 2) Save the FULL file (all leads: valid, catch-all, invalid) ---
-    updated_leads.to_excel(output_file_all, index=False)
-    if debug:
-        print(f"[DEBUG] Wrote full results (including invalid) to '{output_file_all}'")
+    if output_file_all:
+        write_leads(updated_leads, output_file_all)
+        if debug:
+            print(f"[DEBUG] Wrote full results (including invalid) to '{output_file_all}'")
 
     # --- 3) Create a second DataFrame with only Valid or Catch-All ---
-    valid_df = updated_leads[updated_leads["EMAIL STATUS"].isin(["Valid", "Catch-All"])]
+    mask = updated_leads["EMAIL STATUS"].isin(["Valid", "Catch-All"]).to_numpy()
 
-    # Sort by 'COMPANY' in ascending order
-    valid_df = valid_df.sort_values(by="COMPANY", ascending=True)
+    # Sort by 'COMPANY' in ascending order, keeping input order within a company
+    valid_df = updated_leads.loc[mask].sort_values(by="COMPANY", ascending=True, kind="stable", ignore_index=True)
 
     # Save this second file
-    valid_df.to_excel(output_file_valid, index=False)
+    write_leads(valid_df, output_file_valid)
     if debug:
         print(f"[DEBUG] Wrote valid/catch-all results to '{output_file_valid}'")
 
-    # Save updated dynamic DB
-    save_dynamic_db(dynamic_db, debug=debug)
+    # Save MV results (the dynamic DB is updated as validation goes)
+    save_verify_cache(verify_cache, debug=debug)
     if debug:
         print("[DEBUG] Validation process complete.")
 
+    return valid_df
+
 # -----------------------------------------------------
 # Main function
 # -----------------------------------------------------
@@ -425,14 +668,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--input_file",
         type=str,
-        default="../output/processed_test_leads.xlsx",
-        help="Path to the processed leads Excel file."
+        default="../output/processed_test_leads.parquet",
+        help="Path to the processed leads file (.parquet or .xlsx)."
     )
     parser.add_argument(
         "--output_file_all",
         type=str,
-        default="../output/pro_processed_test_leads.xlsx",
-        help="Path to save the full validated leads."
+        default="../output/pro_processed_test_leads.parquet",
+        help="Path to save the full validated leads (.parquet or .xlsx)."
     )
     parser.add_argument(
         "--output_file_valid",
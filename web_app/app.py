@@ -1,7 +1,16 @@
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, Response, request, jsonify, send_file, render_template
 import os
 import uuid
 import sys
+import fcntl
+import shutil
+import tempfile
+import time
+import threading
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.utils import secure_filename
 
 # 1) Add scripts dir to Python path
 SCRIPT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data_pipelining/scripts"))
@@ -18,7 +27,191 @@ PROCESSED_FOLDER = os.path.join(BASE_DIR, "processed")
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 
+# Bytes per read when saving an upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Most recent log lines kept per job
+LOG_LINES = 500
+
+# Seconds between keep-alive comments on an idle progress stream
+STREAM_KEEPALIVE = 15
+
+# Set REDIS_URL to keep job logs and status in Redis, so that with several
+# app processes (e.g. gunicorn -w 4) any of them can answer /progress and
+# /download for any job. Without it they are kept in this process.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    import redis
+    redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+else:
+    redis_client = None
+
+# How long Redis keeps a job's log and status, in seconds
+JOB_TTL = 24 * 60 * 60
+
+# Seconds between checks for new lines when streaming a log from Redis
+REDIS_POLL_INTERVAL = 1
+
+# Seconds a browser may cache a processed file; it never changes once written
+DOWNLOAD_MAX_AGE = 60 * 60
+
+# Set ACCEL_REDIRECT_PREFIX to an nginx 'internal' location that maps to
+# PROCESSED_FOLDER (e.g. /protected/) to have nginx send processed files
+# itself via X-Accel-Redirect instead of this app.
+ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX")
+
+# Pipeline futures submitted by this process
+jobs = {}
+
+# In-process job state, used without REDIS_URL
 logs = {}
+# Lines ever logged per job (logs[job_id] only holds the last LOG_LINES)
+log_totals = {}
+# "queued", "running" or "done" per job
+job_status = {}
+# Wakes /progress_stream responses when a line is logged
+logs_changed = threading.Condition()
+
+# Pipelines run in a worker process so /process can return right away.
+# A single worker, since the pipeline steps share learned-pattern and
+# cache files under data/ that concurrent runs would overwrite. That only
+# holds within one app process; with several (e.g. gunicorn -w 4) runs are
+# serialized by an exclusive lock on PIPELINE_LOCK_FILE instead.
+pipeline_executor = ProcessPoolExecutor(max_workers=1)
+PIPELINE_LOCK_FILE = os.path.join(SCRIPT_DIR, "..", "data", ".pipeline.lock")
+
+def add_log(job_id, line, final=False):
+    """
+    Append a line to a job's log and wake any streams following it.
+    'final' marks the job's last line, and the job as done.
+    """
+    if redis_client is not None:
+        log_key, job_key = f"log:{job_id}", f"job:{job_id}"
+        with redis_client.pipeline() as pipe:
+            pipe.rpush(log_key, line)
+            pipe.ltrim(log_key, -LOG_LINES, -1)
+            pipe.hincrby(job_key, "total", 1)
+            if final:
+                pipe.hset(job_key, "status", "done")
+            pipe.expire(log_key, JOB_TTL)
+            pipe.expire(job_key, JOB_TTL)
+            pipe.execute()
+        return
+
+    with logs_changed:
+        if job_id not in logs:
+            logs[job_id] = deque(maxlen=LOG_LINES)
+            log_totals[job_id] = 0
+        logs[job_id].append(line)
+        log_totals[job_id] += 1
+        if final:
+            job_status[job_id] = "done"
+        logs_changed.notify_all()
+
+def set_job_status(job_id, status):
+    if redis_client is not None:
+        job_key = f"job:{job_id}"
+        with redis_client.pipeline() as pipe:
+            pipe.hset(job_key, "status", status)
+            pipe.expire(job_key, JOB_TTL)
+            pipe.execute()
+        return
+
+    with logs_changed:
+        job_status[job_id] = status
+
+def get_job_status(job_id):
+    """
+    Return a job's stored status, or None for a job we know nothing about.
+    """
+    if redis_client is not None:
+        return redis_client.hget(f"job:{job_id}", "status")
+    with logs_changed:
+        return job_status.get(job_id)
+
+def job_exists(job_id):
+    if redis_client is not None:
+        return bool(redis_client.exists(f"job:{job_id}"))
+    with logs_changed:
+        return job_id in logs
+
+def read_log(job_id):
+    """
+    Return (lines ever logged, last LOG_LINES lines, status) for a job.
+    """
+    if redis_client is not None:
+        with redis_client.pipeline() as pipe:
+            pipe.hmget(f"job:{job_id}", "total", "status")
+            pipe.lrange(f"log:{job_id}", 0, -1)
+            (total, status), lines = pipe.execute()
+        return int(total or 0), lines, status
+
+    with logs_changed:
+        return log_totals.get(job_id, 0), list(logs.get(job_id, ())), job_status.get(job_id)
+
+def wait_for_log(job_id, seen, timeout):
+    """
+    Wait until a job has logged more than 'seen' lines or is done, or
+    until 'timeout' seconds have passed.
+    """
+    if redis_client is not None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            total, status = redis_client.hmget(f"job:{job_id}", "total", "status")
+            if int(total or 0) > seen or status == "done":
+                return
+            time.sleep(REDIS_POLL_INTERVAL)
+        return
+
+    with logs_changed:
+        logs_changed.wait_for(
+            lambda: log_totals.get(job_id, 0) > seen or job_status.get(job_id) == "done",
+            timeout=timeout
+        )
+
+def run_job(job_id, input_file, output_file):
+    """
+    Run one job's pipeline. Called in the pipeline worker process, where
+    the status update only reaches other processes through Redis. Waits
+    while another app process's pipeline is running.
+    """
+    with open(PIPELINE_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            set_job_status(job_id, "running")
+            run_pipeline(input_file, output_file)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def log_pipeline_result(job_id, future):
+    error = future.exception()
+    if error is None:
+        add_log(job_id, "Pipeline completed!", final=True)
+    else:
+        add_log(job_id, f"Error: {str(error)}", final=True)
+
+def stream_logs(job_id):
+    """
+    Yield a job's log as Server-Sent Events: one message per line as it is
+    logged, then a 'done' event once the pipeline has finished.
+    """
+    seen = 0
+    while True:
+        wait_for_log(job_id, seen, STREAM_KEEPALIVE)
+        total, job_logs, status = read_log(job_id)
+        new = total - seen
+        lines = job_logs[-new:] if new > 0 else []
+        seen = total
+        for line in lines:
+            # A line break inside a message needs its own 'data:' field
+            yield "".join(f"data: {part}\n" for part in line.split("\n")) + "\n"
+        if status == "done":
+            yield "event: done\ndata: \n\n"
+            return
+        if not lines:
+            yield ": keep-alive\n\n"
 
 @app.route('/')
 def index():
@@ -27,13 +220,23 @@ def index():
 @app.route('/upload', methods=['POST'])
 def upload_file():
     file = request.files['file']
-    if not file.filename.endswith('.xlsx'):
+    if not secure_filename(file.filename or "").lower().endswith('.xlsx'):
         return jsonify({"error": "Invalid file format"}), 400
 
+    # The saved name comes from the job id, never from the client's filename.
+    # Copy in 1 MB chunks to a temp file and rename it into place, so the
+    # pipeline never sees a half-written upload.
     job_id = str(uuid.uuid4())
     upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}.xlsx")
-    file.save(upload_path)
-    logs[job_id] = ["File uploaded successfully"]
+    with tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], suffix=".part", delete=False) as dst:
+        try:
+            shutil.copyfileobj(file.stream, dst, length=UPLOAD_CHUNK_SIZE)
+        except BaseException:
+            dst.close()
+            os.remove(dst.name)
+            raise
+    os.replace(dst.name, upload_path)
+    add_log(job_id, "File uploaded successfully")
 
     return jsonify({"job_id": job_id})
 
@@ -45,31 +248,70 @@ def process_job():
     upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}.xlsx")
     final_output = os.path.join(app.config['PROCESSED_FOLDER'], f"{job_id}_processed.xlsx")
 
-    logs[job_id].append("Starting pipeline...")
-    try:
-        run_pipeline(upload_path, final_output)
-        logs[job_id].append("Pipeline completed!")
-    except Exception as e:
-        logs[job_id].append(f"Error: {str(e)}")
+    add_log(job_id, "Starting pipeline...")
+    set_job_status(job_id, "queued")
+    future = pipeline_executor.submit(run_job, job_id, upload_path, final_output)
+    jobs[job_id] = future
+    future.add_done_callback(lambda f: log_pipeline_result(job_id, f))
 
-    return jsonify({"status": "processing started"})
+    return jsonify({"status": "processing started"}), 202
 
 @app.route('/progress', methods=['GET'])
 def progress():
     job_id = request.args.get('job_id')
-    return jsonify({"logs": logs.get(job_id, [])})
+    _, job_logs, stored_status = read_log(job_id)
+    future = jobs.get(job_id)
+    if future is None:
+        # Submitted by another app process, if at all
+        status = stored_status or "not started"
+    elif future.done():
+        status = "done"
+    elif future.running():
+        status = "running"
+    else:
+        status = "queued"
+    return jsonify({"logs": job_logs, "status": status})
+
+@app.route('/progress_stream', methods=['GET'])
+def progress_stream():
+    job_id = request.args.get('job_id')
+    if not job_exists(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    return Response(
+        stream_logs(job_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.route('/download', methods=['GET'])
 def download():
     job_id = request.args.get('job_id')
     output_path = os.path.join(app.config['PROCESSED_FOLDER'], f"{job_id}_processed.xlsx")
-    if not os.path.exists(output_path):
+    # A job still in progress may have a half-written output file
+    if get_job_status(job_id) not in (None, "done") or not os.path.exists(output_path):
         return jsonify({"error": "File not found or still processing"}), 404
-    return send_file(
+    if ACCEL_REDIRECT_PREFIX:
+        response = Response(mimetype=XLSX_MIMETYPE)
+        response.headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX + os.path.basename(output_path)
+        response.headers["Content-Disposition"] = f'attachment; filename="{os.path.basename(output_path)}"'
+        response.cache_control.private = True
+        response.cache_control.max_age = DOWNLOAD_MAX_AGE
+        return response
+    # conditional=True answers Range and If-Modified-Since requests, and the
+    # file is handed to the WSGI server's file wrapper (sendfile) unread
+    response = send_file(
         output_path,
         as_attachment=True,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        conditional=True,
+        max_age=DOWNLOAD_MAX_AGE,
+        mimetype=XLSX_MIMETYPE
     )
+    # Processed files hold contact details, so only the user's own browser
+    # may cache them, not shared proxies (max_age makes send_file mark
+    # them public)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 if __name__ == '__main__':
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)